@@ -1,10 +1,21 @@
-import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from io import BytesIO
 
 import pandas as pd
 import streamlit as st
+import xlsxwriter
 from google import genai
 from google.genai import types
+from pydantic import BaseModel
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# orjson parses the response faster, stdlib json is the fallback
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 # setup page
 st.set_page_config(page_title="Info Extractor", layout="wide")
@@ -19,10 +30,7 @@ st.markdown("""
 try:
     GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
 except (KeyError, FileNotFoundError):
-    st.error(
-        "GEMINI_API_KEY not found. Please add it to your .streamlit/secrets.toml file."
-    )
-    st.stop()
+    GEMINI_API_KEY = None
 
 if not GEMINI_API_KEY:
     st.error(
@@ -30,143 +38,222 @@ if not GEMINI_API_KEY:
     )
     st.stop()
 
-def extract_with_gemini(file_bytes, api_key):
-    # setup gemini client
-    client = genai.Client(api_key=api_key)
-
-    # extraction prompt for the ai
-    prompt = """
-    You are a Data Extraction Specialist. Your goal is to convert the provided document
-    into a strict, structured JSON format optimized for Excel analysis.
-
-    **Example:**
-        - *Source Text:* "Born in the Pink City (Jaipur), which provides regional context."
-        - *Expected Extraction:*
-        {
-          "Key": "Birth City",
-          "Value": "Jaipur",
-          "Comments": "Born and raised in the Pink City of India, provides regional profiling context."
-        }
-
-    SECTION 1: DATA FORMATTING STANDARDS
-    
-    **Date Handling:**
-    - Convert ALL dates to DD-Mon-YY format where Mon is the abbreviated month name
-    - Example: "March 15, 1989" becomes "15-Mar-89"
-    
-    **Name Processing:**
-    - Always split full names into separate "First Name" and "Last Name" fields
-    
-    **Location Processing:**
-    - Segregate location information into "City" and "State" fields where applicable
-    
-    **Currency Formatting:**
-    - Keep currency values clean without unnecessary decimals (e.g., "350,000 INR")
-
-    SECTION 2: COMMENT STRATEGY & CONTEXTUAL INFORMATION
-    
-    Comments are designed to capture supplementary information that enhances the primary
-    key-value pair without cluttering the main data. Follow these guidelines:
-    
-    - Include comments only when additional context is present or valuable
-    - Preserve the original wording from the source document in comments
-    - Empty comments are acceptable when no extra information exists
-    - Vague or ambiguous fields may contain only comments if the exact value is unclear
-
-    SECTION 3: EMPLOYMENT & ORGANIZATIONAL DATA
-    
-    For employment history, create separate entries for current and previous positions:
-    - Current Role: "Current Organisation", "Current Joining Date", "Current Salary", "Current Designation"
-    - Previous Roles: Follow similar naming pattern with "Previous" prefix
-    - Attach extra information as comments to respective entries
-
-    SECTION 4: EDUCATIONAL QUALIFICATIONS
-    
-    Segregate education into distinct qualification levels:
-    
-    High School:
-    - School name, 12th Standard pass-out year, grades
-    
-    Undergraduate Degree:
-    - College name, graduation year, CGPA (prefixed with "Undergraduate")
-    
-    Graduate/Post-Graduate:
-    - Institution name, completion year, CGPA (prefixed with "Graduate" or "Post-Graduate")
-
-    SECTION 5: CERTIFICATIONS & PROFICIENCIES
-    
-    - List each certificate as a separate keyed entry (e.g., "Certificate 1", "Certificate 2")
-    - Mention each certification only once
-    - Include issuing organization, date, or other details as comments
-    - Add a single "Proficiencies" field summarizing technical or professional skills
-
-    FINAL INSTRUCTIONS
-    
-    - Return ONLY valid JSON; no explanatory text or conversation
-    - Structure the data with # (serial number), Key, Value, and Comments columns
-    - Use logical, human-readable field names that are self-explanatory
-    - Handle unlisted fields intelligently using common sense and context from the document
-    - Maintain consistency in naming conventions throughout
-    """
-
-    # send pdf to gemini with prompt
+# extraction prompt for the ai
+_EXTRACTION_PROMPT = """
+Extract every fact in the document as Key/Value/Comments rows for Excel.
+
+Example: "Born in the Pink City (Jaipur), which provides regional context." ->
+Key "Birth City", Value "Jaipur", Comments "Born and raised in the Pink City of India, provides regional profiling context."
+
+Formatting:
+- Dates as DD-Mon-YY ("March 15, 1989" -> "15-Mar-89")
+- Split names into "First Name" and "Last Name", locations into "City" and "State"
+- Currency without needless decimals ("350,000 INR")
+
+Comments:
+- Only for extra context, kept in the document's original wording; otherwise empty
+- If a value is vague, leave Value empty and put the text in Comments
+
+Sections:
+- Employment: "Current Organisation", "Current Joining Date", "Current Salary", "Current Designation"; same keys with "Previous" for earlier roles
+- Education: school name, 12th Standard pass-out year and grades; college, year and CGPA prefixed "Undergraduate", "Graduate" or "Post-Graduate"
+- Certificates: one row each ("Certificate 1", "Certificate 2"), no repeats, issuer and date in Comments
+- One "Proficiencies" row summarising skills
+
+Use clear, consistent, self-explanatory keys and sensible keys for anything not listed.
+"""
+_PROMPT_PART = types.Part.from_text(text=_EXTRACTION_PROMPT)
+
+
+# columns of the output table, in display order; multi-pdf extractions get
+# an extra File column in front naming the source pdf
+_COLUMNS = ("Key", "Value", "Comments")
+
+# max number of pdfs sent to gemini at the same time
+_MAX_CONCURRENT_EXTRACTIONS = 8
+
+
+class Row(BaseModel):
+    # one extracted field, gemini is forced to return a flat list of these
+    Key: str
+    Value: str
+    Comments: str
+
+
+# request settings that are the same for every call, built once
+_MODEL = "gemini-2.5-flash"
+_PDF_MIME_TYPE = "application/pdf"
+
+# inline requests are capped at 20 MB and the pdf grows by a third when
+# base64 encoded; 14 MB encodes to about 18.7 MB, leaving room for the prompt
+# and request envelope, so bigger pdfs go through the file api instead
+_INLINE_PDF_LIMIT = 14 * 1000 * 1000
+
+_GEN_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema=list[Row],
+)
+
+# fingerprint of model, schema and prompt, part of the extraction cache key
+# so editing any of them stops serving results made with the old ones
+_PROMPT_VERSION = hashlib.sha256(
+    f"{_MODEL}\n{Row.model_json_schema()}\n{_EXTRACTION_PROMPT}".encode()
+).hexdigest()
+
+
+@st.cache_resource
+def get_genai_client(api_key):
+    # one gemini client shared across reruns, keeps its connection pool alive
+    return genai.Client(api_key=api_key)
+
+
+# large pdfs are uploaded once per sha256 (doc_id) and referenced by uri;
+# gemini deletes uploaded files after 48 hours, so the uri is kept for less
+@st.cache_data(ttl=timedelta(hours=47), show_spinner=False, max_entries=32)
+def upload_pdf(doc_id, _uploaded_file, _api_key):
+    client = get_genai_client(_api_key)
+    _uploaded_file.seek(0)
+    uploaded = client.files.upload(
+        file=_uploaded_file,
+        config=types.UploadFileConfig(mime_type=_PDF_MIME_TYPE),
+    )
+    return uploaded.uri
+
+
+# results are cached in memory by the pdf's sha256 (doc_id) and the prompt
+# version, so repeat uploads skip the api call; the uploaded file and api key
+# are left out of the cache key
+@st.cache_data(show_spinner=False, max_entries=32)
+def extract_with_gemini(doc_id, prompt_version, _uploaded_file, _api_key):
+    client = get_genai_client(_api_key)
+
+    if _uploaded_file.size > _INLINE_PDF_LIMIT:
+        file_uri = upload_pdf(doc_id, _uploaded_file, _api_key)
+        pdf_part = types.Part.from_uri(file_uri=file_uri, mime_type=_PDF_MIME_TYPE)
+    else:
+        # pdf bytes are only copied out of the upload on a cache miss
+        file_bytes = _uploaded_file.getvalue()
+        pdf_part = types.Part.from_bytes(data=file_bytes, mime_type=_PDF_MIME_TYPE)
+
+    # send pdf to gemini with the prompt after it, as gemini recommends for
+    # document understanding
     response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=[
-            types.Part.from_bytes(data=file_bytes, mime_type="application/pdf"),
-            prompt,
-        ],
-        config=types.GenerateContentConfig(
-            response_mime_type="application/json"
-        ),
+        model=_MODEL,
+        contents=[pdf_part, _PROMPT_PART],
+        config=_GEN_CONFIG,
     )
-    return response.text
+
+    # parse here so empty or broken responses raise and are never cached
+    if response.text is None:
+        raise ValueError("Gemini returned an empty response")
+    return json_loads(response.text)
 
 
-# file upload
-uploaded_file = st.file_uploader("Upload your PDF document", type=["pdf"])
+def extract_all(uploaded_files, api_key):
+    # hash each upload in place
+    doc_ids = [hashlib.sha256(f.getbuffer()).hexdigest() for f in uploaded_files]
 
-if uploaded_file and st.button("Start Extraction"):
-    with st.spinner("Analyzing document..."):
+    # gemini calls are network bound, so run them side by side in threads;
+    # the workers share this run's context so the cache behaves as usual
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(
+        max_workers=_MAX_CONCURRENT_EXTRACTIONS,
+        initializer=add_script_run_ctx,
+        initargs=(None, ctx),
+    ) as executor:
+        futures = [
+            executor.submit(extract_with_gemini, doc_id, _PROMPT_VERSION, f, api_key)
+            for doc_id, f in zip(doc_ids, uploaded_files)
+        ]
+
+    # collect per file, one failed pdf doesn't drop the others
+    results, errors = [], []
+    for f, future in zip(uploaded_files, futures):
         try:
-            # read file and extract with gemini
-            file_bytes = uploaded_file.getvalue()
-            json_result = extract_with_gemini(file_bytes, GEMINI_API_KEY)
-            st.success("Extraction completed successfully")
+            results.append((f.name, future.result()))
+        except Exception as e:
+            errors.append((f.name, e))
+    return results, errors
 
-            # parse json response
-            data = json.loads(json_result)
 
-            # handle nested json
-            if isinstance(data, dict):
-                data = list(data.values())[0]
+def build_excel(rows, columns):
+    # write rows straight to xlsx, per-file serial number first, no dataframe
+    # needed; rows go strictly top to bottom, so constant_memory can flush
+    # each one
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    worksheet = workbook.add_worksheet()
+    header_format = workbook.add_format(
+        {"bold": True, "border": 1, "align": "center", "valign": "top"}
+    )
+    worksheet.write_row(0, 0, ("#", *columns), header_format)
+    for i, row in enumerate(rows, 1):
+        worksheet.write_row(i, 0, (row["#"], *(row.get(k, "") for k in columns)))
+    workbook.close()
+    return output
 
-            # convert to dataframe
-            df = pd.DataFrame(data)
 
-            # reorder columns
-            if "Comments" in df.columns:
-                cols = ["Key", "Value", "Comments"]
-                df = df[[c for c in cols if c in df.columns]]
+def clear_extraction():
+    # new uploads make the previous result stale
+    st.session_state.pop("extraction", None)
 
-            # show preview
-            st.dataframe(df, width="stretch")
 
-            # add serial numbers
-            df.insert(0, "#", range(1, len(df) + 1))
+# upload and extract in a fragment, so its widgets only rerun this part
+@st.fragment
+def extraction_flow():
+    # file upload
+    uploaded_files = st.file_uploader(
+        "Upload your PDF documents",
+        type=["pdf"],
+        accept_multiple_files=True,
+        on_change=clear_extraction,
+    )
 
-            # create excel file
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                df.to_excel(writer, index=False)
+    if uploaded_files and st.button("Start Extraction"):
+        with st.spinner("Analyzing documents..."):
+            try:
+                # extract all pdfs with gemini, results keep the upload order
+                results, errors = extract_all(uploaded_files, GEMINI_API_KEY)
+                for name, e in errors:
+                    st.error(f"An error occurred during extraction of {name}: {e}")
 
-            # download button
-            st.download_button(
-                label="Download Output.xlsx",
-                data=output.getvalue(),
-                file_name="Output.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            )
+                if results:
+                    if not errors:
+                        st.success("Extraction completed successfully")
 
-        except Exception as e:
-            st.error(f"An error occurred during extraction: {e}")
+                    # merge the rows of all pdfs into one list, tagged with
+                    # their file and numbered per file
+                    data = [
+                        {"#": serial, "File": name, **row}
+                        for name, rows in results
+                        for serial, row in enumerate(rows, 1)
+                    ]
+
+                    # single pdf keeps the plain layout, several get a File column
+                    columns = _COLUMNS
+                    if len(uploaded_files) > 1:
+                        columns = ("File", *_COLUMNS)
+
+                    # dataframe is only needed for the preview, excel file is
+                    # created from the rows; both are kept for later reruns
+                    df = pd.DataFrame.from_records(data, columns=columns)
+                    st.session_state.extraction = (df, build_excel(data, columns))
+
+            except Exception as e:
+                st.error(f"An error occurred during extraction: {e}")
+
+    # show the last result, clicking download won't extract again
+    if "extraction" in st.session_state:
+        df, output = st.session_state.extraction
+        st.dataframe(df, width="stretch")
+
+        # download button, streamlit rewinds and reads the buffer itself
+        st.download_button(
+            label="Download Output.xlsx",
+            data=output,
+            file_name="Output.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+
+
+extraction_flow()